@@ -8,7 +8,8 @@ from flask import Flask, request, jsonify
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.genai import types
-from agent import root_agent
+from agent import create_research_agent, SEARCH_MODES
+from tools import normalize_domains
 
 # Fix emoji issues in Windows Terminal
 if sys.platform == "win32":
@@ -63,13 +64,17 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Initialize Session Service and Runner once
+# Initialize Session Service and one Runner per search mode once
+# (each agent only carries the prompt rules for its own mode)
 session_service = InMemorySessionService()
-runner = Runner(
-    agent=root_agent,
-    app_name="research_app", 
-    session_service=session_service
-)
+runners = {
+    mode: Runner(
+        agent=create_research_agent(mode),
+        app_name="research_app", 
+        session_service=session_service
+    )
+    for mode in SEARCH_MODES
+}
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -105,7 +110,28 @@ def handle_a2a_task():
             }), 400
         
         mode = task_data.get("search_mode", "normal")
-        domains = task_data.get("domains", [])
+        if mode not in runners:
+            return jsonify({
+                "status": "error",
+                "error": f"Invalid search_mode '{mode}'. Expected one of: {', '.join(SEARCH_MODES)}"
+            }), 400
+
+        domains = task_data.get("domains") or []
+        if isinstance(domains, str):
+            domains = [domains]
+        if not isinstance(domains, list):
+            return jsonify({
+                "status": "error",
+                "error": "Field 'domains' must be a list of domains/URLs"
+            }), 400
+
+        # Normalize once here; tools reuse the tuple from session state
+        domains = normalize_domains(domains)
+        if mode in ("url", "hybrid") and not domains:
+            return jsonify({
+                "status": "error",
+                "error": f"search_mode '{mode}' requires at least one valid domain in 'domains'"
+            }), 400
         max_results = task_data.get("max_results_per_tool", 10)
 
         logger.info(f"🚀 Starting | Session: {session_id} | Query: {query}")
@@ -114,13 +140,14 @@ def handle_a2a_task():
         asyncio.run(session_service.create_session(
             user_id=user_id,
             session_id=session_id,
-            app_name="research_app"
+            app_name="research_app",
+            state={"domains": domains, "search_mode": mode}
         ))
 
         # Prepare Prompt
         prompt = f"""Query: {query}
 Search Mode: {mode}
-Domains: {domains if domains else "None"}
+Domains: {list(domains) if domains else "None"}
 Max Results per Tool: {max_results}"""
 
         content = types.Content(role="user", parts=[types.Part(text=prompt)])
@@ -128,7 +155,7 @@ Max Results per Tool: {max_results}"""
         final_text_parts = []
         
         # Run agent and collect responses
-        for event in runner.run(
+        for event in runners[mode].run(
             user_id=user_id,
             session_id=session_id,
             new_message=content
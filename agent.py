@@ -2,116 +2,121 @@ import os
 from google import genai
 from google.adk.agents import LlmAgent
 from google.adk.models.google_llm import Gemini
-from tools import search_tavily_tool, search_exa_tool, search_with_urls_tool
+from tools import search_tavily_tool, search_exa_tool, search_with_urls_tool, search_all_tool
 
-research_instruction = """
+# ===== SYSTEM PROMPT =====
+# Only the rules for the caller's search_mode are sent, so the static prompt stays small.
+_BASE = """
     # ROLE
-    You are the "ULTIMATE Online RESEARCH ORCHESTRATOR". Your goal is to provide high-fidelity, autonomous research by managing planning, parallel tool execution, and rigorous data synthesis.
-
-    # USER REQUEST PARAMETERS (Always provided in every task)
-    Every task you receive will include these tunable parameters:
-    - Query: The main research topic or question
-    - Search Mode: "normal" | "url" | "hybrid"  (controls tool usage strategy)
-    - Domains: List of domains/URLs (optional, required for "url" and "hybrid" modes)
-    - Max Results per Tool: Guideline number (default 10-15; you may adjust slightly if needed)
-
-    # TOOLS STRATEGY (Parameter-Driven Intelligence)
-    You MUST strictly respect the search_mode parameter:
-
-    1. **search_with_urls_tool** (Domain-restricted search)
-    - ALWAYS use this as the PRIMARY tool when:
-        - search_mode = "url" → Use ONLY this tool (guarantees results from specified domains)
-        - search_mode = "hybrid" → ALWAYS include this tool with the provided domains for authoritative validation
-    - Parameters to tune:
-        - urls = the exact domains list provided by user
-        - use_tool = "auto" (default) or "exa" for academic/technical, "tavily" for structured/business
-        - max_results = user-provided value (or 10-15)
-
-    2. **search_tavily_tool** (Structured broad search)
-    - Use when:
-        - search_mode = "normal" → Primary tool for broad overviews
-        - search_mode = "hybrid" → Use for market data, tables, business intelligence
-    - Parameters to tune:
-        - search_depth = "advanced" (default for depth)
-        - max_results = user-provided value
-
-    3. **search_exa_tool** (Deep neural/semantic search)
-    - Use when:
-        - search_mode = "normal" → Primary tool for hidden/deep content
-        - search_mode = "hybrid" → Use for technical depth and academic insights
-        - Academic/technical queries even in other modes
-    - Parameters to tune:
-        - num_results = user-provided value
-        - use_autoprompt = True (recommended)
-
-    # TOOL SELECTION RULES BASED ON SEARCH_MODE
-    - "url" mode     → ONLY search_with_urls_tool (domains required)
-    - "hybrid" mode  → ALL three tools (search_with_urls_tool mandatory with provided domains)
-    - "normal" mode  → search_tavily_tool + search_exa_tool (no domain restrictions)
+    You are the "ULTIMATE Online RESEARCH ORCHESTRATOR": plan research, run search tools in parallel, and synthesize the data rigorously.
 
-    # WORKFLOW
+    # TASK PARAMETERS (provided in every task)
+    Query, Search Mode ("normal" | "url" | "hybrid"), Domains (list or "None"), Max Results per Tool (guideline, default 10-15).
 
-    ## PHASE 1: STRATEGIC PLANNING
-    - Analyze the query and ALL provided parameters (especially search_mode and domains).
-    - Break query into 3-5 specific Research Tracks (e.g., Market Size, Key Players, Technology Trends, Regulatory, Projections).
-    - Assign optimal tool(s) to each track based on search_mode rules above.
-    - Plan parallel execution.
+    # WORKFLOW
+    ## PHASE 1: PLANNING
+    - Split the query into 3-5 Research Tracks (e.g., Market Size, Key Players, Technology Trends, Regulatory, Projections).
+    - Assign tools per the SEARCH MODE RULES; issue all independent tool calls in the same turn.
 
     ## PHASE 2: EVALUATION & SCORING
-    For every finding:
-    - Score 0-10: Relevance, Credibility, Recency, Completeness, Actionability
-    - Overall Score = (Relevance × 0.35) + (Credibility × 0.25) + (Recency × 0.15) + (Completeness × 0.15) + (Actionability × 0.10)
-    - Discard < 6.0
+    - Score each finding 0-10 on Relevance, Credibility, Recency, Completeness, Actionability
+    - Overall = 0.35×Relevance + 0.25×Credibility + 0.15×Recency + 0.15×Completeness + 0.10×Actionability; discard < 6.0
     - Flag contradictions and gaps explicitly
 
-    ## PHASE 3: REPORT GENERATION
-    Generate a concise, high-quality Markdown report:
-
-    1. **Executive Summary** (2-3 paragraphs: core findings, key metrics, main takeaway)
-
-    2. **Research Plan**
-    - Query: [repeat user query]
-    - Search Mode: [repeat mode]
-    - Domains Used: [list or "None"]
-    - Research Tracks (3-5 listed with assigned tools)
-
-    3. **Detailed Findings**
-    - Organized by track
-    - Use bullet points and TABLES for data (market shares, comparisons, timelines)
-    - Include quality scores and source URLs for key claims
-
-    4. **Critical Analysis**
-    - Contradictions (with sources)
-    - Data Gaps & Limitations
-    - Confidence Level (HIGH/MEDIUM/LOW)
-    - Innovation Opportunities & Emerging Trends
-    - Uncertainties/Risks
-
-    5. **Sources & Citations**
-    - Group by tool
-    - Format: [Tool] - URL - Title - Score: X.X/10
-
-    # KEY GUIDELINES
-    - ALWAYS respect search_mode and domains exactly as provided
-    - Cite every claim with URL
-    - Use tables for competitive landscapes, metrics, comparisons
-    - Parallel tool execution when possible
-    - Quality over quantity: prioritize findings ≥ 8.0
-    - Be transparent about gaps and contradictions
-    - Never speculate – flag missing data
+    ## PHASE 3: MARKDOWN REPORT
+    1. **Executive Summary**: 2-3 paragraphs (core findings, key metrics, main takeaway)
+    2. **Research Plan**: Query, Search Mode, Domains Used (or "None"), Research Tracks with assigned tools
+    3. **Detailed Findings**: by track; bullets and TABLES for data (market shares, comparisons, timelines); quality scores and source URLs for key claims
+    4. **Critical Analysis**: Contradictions (with sources), Data Gaps & Limitations, Confidence Level (HIGH/MEDIUM/LOW), Innovation Opportunities & Emerging Trends, Uncertainties/Risks
+    5. **Sources & Citations**: grouped by tool, as "[Tool] - URL - Title - Score: X.X/10"
+
+    # GUIDELINES
+    - Respect Search Mode and Domains exactly; cite every claim with its URL
+    - Prefer findings ≥ 8.0; never speculate – flag missing data
     """
 
-# Initialize the simplified research agent
-root_agent = LlmAgent(
-    name="research_agent",
-    model="gemini-2.5-flash",
-    instruction=research_instruction,
-    tools=[
-        search_tavily_tool,
-        search_exa_tool,
-        search_with_urls_tool
-    ]
-)
+_RULES = {
+    "normal": """
+    # SEARCH MODE RULES: "normal" (no domain restrictions)
+    - Per track: search_all(tools=["tavily", "exa"], max_results=<Max Results>)
+    - Single-engine tracks: search_tavily_async (structured/business data, search_depth="advanced") or search_exa_async (deep technical/academic content, use_autoprompt=True)
+    """,
+    "url": """
+    # SEARCH MODE RULES: "url"
+    - Use ONLY search_with_urls_async(urls=<Domains exactly as given>, max_results=<Max Results>)
+    """,
+    "hybrid": """
+    # SEARCH MODE RULES: "hybrid"
+    - Per track: search_all(tools=["tavily", "exa", "urls"], urls=<Domains exactly as given>, max_results=<Max Results>)
+    - The domain search is mandatory (authoritative validation); Tavily adds market/business data, Exa technical and academic depth
+    """,
+}
+
+SEARCH_MODES = tuple(_RULES)
+
+research_tools = [
+    search_tavily_tool,
+    search_exa_tool,
+    search_with_urls_tool,
+    search_all_tool
+]
+
+# Engines each search mode may use. Resolved here instead of by the model, so a
+# mode's agent only receives (and can only call) its own tools.
+_MODE_ENGINES = {
+    "normal": ["tavily", "exa"],
+    "url": ["urls"],
+    "hybrid": ["tavily", "exa", "urls"],
+}
+_ENGINE_TOOLS = {
+    "tavily": search_tavily_tool,
+    "exa": search_exa_tool,
+    "urls": search_with_urls_tool,
+}
+
+def select_tools(search_mode: str = None) -> list:
+    """Tools for one search mode (search_all when it spans several engines), or all of them"""
+    engines = _MODE_ENGINES.get(search_mode)
+    if engines is None:
+        return research_tools
+    tools = [_ENGINE_TOOLS[engine] for engine in engines]
+    if len(engines) > 1:
+        tools.append(search_all_tool)
+    return tools
+
+def build_instruction(search_mode: str = None) -> str:
+    """System prompt for one search mode, or with every mode's rules when none is given"""
+    if search_mode in _RULES:
+        selected = ", ".join(tool.name for tool in select_tools(search_mode))
+        return _BASE + _RULES[search_mode] + f"    SELECTED_TOOLS: {selected}\n"
+    return _BASE + "".join(_RULES.values())
+
+research_instruction = build_instruction()
+
+# ===== SESSION PARAMETERS =====
+# ADK (>= 1.10) already runs every tool call of a model turn concurrently, so the
+# callback only pins the calls to what the request was accepted with. The domain
+# tools read the session's normalized domains from their tool_context themselves.
+def apply_session_params(tool, args, tool_context):
+    """before_tool_callback: keep search_all's engines within the session's search mode"""
+    engines = _MODE_ENGINES.get(tool_context.state.get("search_mode"))
+    if engines and isinstance(args.get("tools"), list):
+        args["tools"] = [t for t in args["tools"] if t in engines]
+    return None
+
+def create_research_agent(search_mode: str = None) -> LlmAgent:
+    """Build the research agent, specialized to a search mode when one is given"""
+    tools = select_tools(search_mode)
+    return LlmAgent(
+        name="research_agent",
+        model="gemini-2.5-flash",
+        instruction=build_instruction(search_mode),
+        tools=tools,
+        before_tool_callback=apply_session_params
+    )
+
+# Initialize the simplified research agent (all modes)
+root_agent = create_research_agent()
 
 
 def get_agent_card() -> dict:
@@ -151,6 +156,10 @@ def get_agent_card() -> dict:
 # Export for external use
 __all__ = [
     'root_agent',
+    'create_research_agent',
+    'build_instruction',
+    'select_tools',
+    'SEARCH_MODES',
     'get_agent_card',
     'research_instruction'
 ]
\ No newline at end of file
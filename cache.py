@@ -0,0 +1,328 @@
+"""
+Semantic response cache for the search tools.
+
+Lookups run through three tiers:
+1. Exact hash of (tool, parameters, normalized query) -> in-memory dict
+2. Cosine similarity over query embeddings (FAISS + sentence-transformers)
+3. Miss -> real API call, result stored for the next lookup
+
+Entries (with their embeddings) are persisted in a SQLite sidecar, and the
+FAISS indexes are rebuilt from it on startup. Expired entries are evicted as
+they are found, and the oldest ones once SEARCH_CACHE_MAX_ENTRIES is exceeded.
+The semantic tier is optional: without faiss / sentence-transformers installed
+only exact matches are served.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import logging
+import sqlite3
+import threading
+from functools import wraps
+
+cache_logger = logging.getLogger("SearchCache")
+
+CACHE_ENABLED = os.getenv("SEARCH_CACHE", "true").lower() == "true"
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".search_cache/search_cache.sqlite3")
+CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000"))
+EMBEDDING_MODEL = os.getenv("SEARCH_CACHE_MODEL", "all-MiniLM-L6-v2")
+
+# Candidates checked per semantic lookup, so expired neighbours don't mask live ones
+_SEARCH_K = 8
+
+
+def _is_cacheable(result) -> bool:
+    """Only cache real results, never errors or empty result lists"""
+    return isinstance(result, list) and bool(result) and not any("error" in r for r in result)
+
+
+class SemanticCache:
+    """Thread-safe store shared by every cached tool"""
+
+    def __init__(self, path: str, ttl: float, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._model_lock = threading.Lock()  # model loading can take seconds; don't block the store
+        self._store = {}      # key -> (result, created), oldest first
+        self._vectors = {}    # key -> (namespace, vector id)
+        self._indexes = {}    # namespace -> (faiss index, {vector id: key})
+        self._next_id = 0
+        self._db = None
+        self._backend = None  # (faiss, numpy) once probed, False if unavailable
+        self._model = None
+        self._loaded = False
+
+    # ----- setup -----
+
+    def _semantic_backend(self):
+        if self._backend is None:
+            try:
+                import faiss
+                import numpy
+                self._backend = (faiss, numpy)
+            except ImportError:
+                cache_logger.info("faiss/numpy not installed, semantic cache tier disabled")
+                self._backend = False
+        return self._backend
+
+    def _disable_semantic_tier(self):
+        with self._lock:
+            self._backend = False
+            self._indexes.clear()
+            self._vectors.clear()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        rows = []
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, namespace TEXT, query TEXT, "
+                "result TEXT, embedding BLOB, created REAL)"
+            )
+            self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, namespace, result, embedding, created FROM entries ORDER BY created"
+            ).fetchall()
+        except (OSError, sqlite3.Error) as e:
+            cache_logger.warning(f"Cache persistence disabled: {e}")
+            self._db = None
+
+        backend = self._semantic_backend()
+        for key, namespace, result, embedding, created in rows:
+            self._store[key] = (json.loads(result), created)
+            if embedding is not None and backend:
+                self._add_vector(namespace, key, backend[1].frombuffer(embedding, dtype="float32"))
+        self._evict()
+        if rows:
+            cache_logger.info(f"Loaded {len(self._store)} cached search results from {self.path}")
+
+    # ----- bookkeeping -----
+
+    def _add_vector(self, namespace: str, key: str, embedding):
+        faiss, numpy = self._backend
+        if namespace not in self._indexes:
+            # IndexIDMap so evicted entries can be removed again with remove_ids
+            self._indexes[namespace] = (faiss.IndexIDMap(faiss.IndexFlatIP(embedding.shape[0])), {})
+        index, keys = self._indexes[namespace]
+        vector_id = self._next_id
+        self._next_id += 1
+        index.add_with_ids(
+            numpy.asarray(embedding, dtype="float32").reshape(1, -1),
+            numpy.array([vector_id], dtype="int64")
+        )
+        keys[vector_id] = key
+        self._vectors[key] = (namespace, vector_id)
+
+    def _forget(self, key: str):
+        """Drop an entry from memory and from its FAISS index"""
+        self._store.pop(key, None)
+        vector = self._vectors.pop(key, None)
+        if vector is None:
+            return
+        namespace, vector_id = vector
+        index, keys = self._indexes[namespace]
+        index.remove_ids(self._backend[1].array([vector_id], dtype="int64"))
+        del keys[vector_id]
+        if not keys:
+            del self._indexes[namespace]
+
+    def _remove(self, keys: list):
+        """Drop entries from memory, the FAISS indexes and the SQLite sidecar"""
+        if not keys:
+            return
+        for key in keys:
+            self._forget(key)
+        if self._db is not None:
+            try:
+                self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+                self._db.commit()
+            except sqlite3.Error as e:
+                cache_logger.warning(f"Failed to delete cache entries: {e}")
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones beyond max_entries.
+        The store is kept in creation order, so both come off its front."""
+        cutoff = time.time() - self.ttl
+        excess = len(self._store) - self.max_entries
+        stale = []
+        for key, (_, created) in self._store.items():
+            if created >= cutoff and len(stale) >= excess:
+                break
+            stale.append(key)
+        self._remove(stale)
+
+    # ----- lookups -----
+
+    def embed(self, query: str):
+        """L2-normalized query embedding, or None when the semantic tier is off"""
+        if not self._semantic_backend():
+            return None
+        with self._model_lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(EMBEDDING_MODEL)
+                except ImportError:
+                    cache_logger.info("sentence-transformers not installed, semantic cache tier disabled")
+                    self._disable_semantic_tier()
+                    return None
+                except Exception as e:  # e.g. model download blocked
+                    cache_logger.warning(f"Failed to load {EMBEDDING_MODEL}, semantic cache tier disabled: {e}")
+                    self._disable_semantic_tier()
+                    return None
+        return self._model.encode(query, normalize_embeddings=True).astype("float32")
+
+    def _live(self, key: str):
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            self._remove([key])
+            return None
+        return entry[0]
+
+    def get(self, key: str):
+        with self._lock:
+            self._load()
+            self._evict()
+            return self._live(key)
+
+    def search(self, namespace: str, embedding, threshold: float):
+        """Closest live entry within `threshold` cosine distance, or None"""
+        with self._lock:
+            self._load()
+            self._evict()
+            if not self._backend or namespace not in self._indexes:
+                return None
+            index, keys = self._indexes[namespace]
+            scores, ids = index.search(embedding.reshape(1, -1), min(_SEARCH_K, index.ntotal))
+            for score, vector_id in zip(scores[0], ids[0]):
+                if vector_id < 0 or 1.0 - score > threshold:
+                    break
+                result = self._live(keys[vector_id])
+                if result is not None:
+                    return result
+            return None
+
+    def put(self, key: str, namespace: str, query: str, result, embedding):
+        created = time.time()
+        with self._lock:
+            self._load()
+            self._forget(key)  # a replaced entry must not leave its old vector behind
+            self._store[key] = (result, created)
+            if embedding is not None and self._backend:
+                self._add_vector(namespace, key, embedding)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, namespace, query, json.dumps(result),
+                         embedding.tobytes() if embedding is not None else None, created)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    cache_logger.warning(f"Failed to persist cache entry: {e}")
+            self._evict()
+
+
+_cache = SemanticCache(CACHE_PATH, CACHE_TTL)
+
+
+def _cache_keys(tool: str, signature: inspect.Signature, args, kwargs):
+    """Build (exact key, namespace, query) for a tool call"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    params = dict(bound.arguments)
+    query = " ".join(str(params.pop("query", "")).lower().split())
+    if params.get("urls") is not None:
+        params["urls"] = sorted(str(u) for u in params["urls"])
+    namespace = json.dumps([tool, params], sort_keys=True, default=str)
+    key = hashlib.sha256(f"{namespace}\x00{query}".encode("utf-8")).hexdigest()
+    return key, namespace, query
+
+
+def _lookup(tool: str, signature: inspect.Signature, args, kwargs, threshold: float):
+    """Run the cache tiers for a call; returns (result, keys, embedding).
+    Any cache fault is logged and treated as a miss, so the real call still runs."""
+    keys, embedding = None, None
+    try:
+        keys = _cache_keys(tool, signature, args, kwargs)
+        key, namespace, query = keys
+        result = _cache.get(key)
+        if result is not None:
+            cache_logger.info(f"Exact cache hit [{tool}]: {query}")
+            return result, keys, embedding
+        embedding = _cache.embed(query)
+        if embedding is not None:
+            result = _cache.search(namespace, embedding, threshold)
+            if result is not None:
+                cache_logger.info(f"Semantic cache hit [{tool}]: {query}")
+                return result, keys, embedding
+    except Exception as e:
+        cache_logger.warning(f"Cache lookup failed [{tool}]: {e}")
+    return None, keys, embedding
+
+
+def _save(tool: str, keys, result, embedding):
+    if keys is None or not _is_cacheable(result):
+        return
+    try:
+        key, namespace, query = keys
+        _cache.put(key, namespace, query, result, embedding)
+    except Exception as e:
+        cache_logger.warning(f"Cache store failed [{tool}]: {e}")
+
+
+def semantic_cache(threshold: float = 0.15):
+    """
+    Cache a search tool by query meaning.
+
+    Calls are namespaced by tool name and all non-query parameters (domains
+    sorted), so results never cross modes. A cached result is reused when its
+    query is within `threshold` cosine distance of the new one. The cache fails
+    open: if it breaks, the tool is simply called.
+    """
+    def decorator(func):
+        tool = func.__name__.removesuffix("_async")
+        signature = inspect.signature(func)
+
+        if not CACHE_ENABLED:
+            return func
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                result, keys, embedding = await asyncio.to_thread(_lookup, tool, signature, args, kwargs, threshold)
+                if result is not None:
+                    return result
+                result = await func(*args, **kwargs)
+                await asyncio.to_thread(_save, tool, keys, result, embedding)
+                return result
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            result, keys, embedding = _lookup(tool, signature, args, kwargs, threshold)
+            if result is not None:
+                return result
+            result = func(*args, **kwargs)
+            _save(tool, keys, result, embedding)
+            return result
+        return wrapper
+
+    return decorator
+
+
+__all__ = ['semantic_cache']
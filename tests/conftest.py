@@ -0,0 +1,12 @@
+import pytest
+
+import cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Fresh cache per test, persisted under tmp_path and without the embedding model"""
+    store = cache.SemanticCache(str(tmp_path / "search_cache.sqlite3"), cache.CACHE_TTL)
+    monkeypatch.setattr(store, "embed", lambda query: None)
+    monkeypatch.setattr(cache, "_cache", store)
+    return store
@@ -0,0 +1,143 @@
+"""Cache tiers, expiry and eviction of the semantic search cache."""
+import sqlite3
+
+import pytest
+
+import cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(cache.time, "time", fake)
+    return fake
+
+
+def counting_search():
+    calls = []
+
+    @cache.semantic_cache(threshold=0.15)
+    def search(query: str, max_results: int = 10):
+        calls.append(query)
+        return [{"title": query, "url": f"https://example.com/{len(calls)}", "snippet": "", "source": "test"}]
+
+    return search, calls
+
+
+def persisted_keys(store):
+    with sqlite3.connect(store.path) as db:
+        return {key for (key,) in db.execute("SELECT key FROM entries")}
+
+
+def test_exact_tier_ignores_case_and_whitespace():
+    search, calls = counting_search()
+
+    first = search("Nile University  innovation")
+    second = search("nile university innovation")
+
+    assert second == first
+    assert len(calls) == 1
+
+
+def test_namespaces_are_isolated():
+    search, calls = counting_search()
+
+    search("q", max_results=5)
+    search("q", max_results=10)
+
+    assert len(calls) == 2
+
+
+def test_expired_entries_are_evicted(clock, isolated_cache):
+    search, calls = counting_search()
+
+    search("old")
+    clock.now += isolated_cache.ttl + 1
+    search("old")
+    search("new")
+
+    assert len(calls) == 2 + 1
+    assert len(isolated_cache._store) == 2
+    assert persisted_keys(isolated_cache) == set(isolated_cache._store)
+
+
+def test_oldest_entries_are_evicted_beyond_max_entries(clock, isolated_cache):
+    isolated_cache.max_entries = 2
+    search, calls = counting_search()
+
+    for query in ("a", "b", "c"):
+        clock.now += 1
+        search(query)
+    search("a")
+
+    assert calls == ["a", "b", "c", "a"]
+    assert len(persisted_keys(isolated_cache)) == 2
+
+
+def test_entries_survive_a_restart(isolated_cache, monkeypatch):
+    search, calls = counting_search()
+    search("q")
+
+    restarted = cache.SemanticCache(isolated_cache.path, isolated_cache.ttl)
+    monkeypatch.setattr(restarted, "embed", lambda query: None)
+    monkeypatch.setattr(cache, "_cache", restarted)
+    search("q")
+
+    assert len(calls) == 1
+
+
+def test_cache_failures_fall_back_to_the_real_call(isolated_cache, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(isolated_cache, "get", broken)
+    monkeypatch.setattr(isolated_cache, "put", broken)
+    search, calls = counting_search()
+
+    assert search("q")[0]["title"] == "q"
+    assert search("q")[0]["title"] == "q"
+    assert len(calls) == 2
+
+
+def test_errors_are_not_cached():
+    calls = []
+
+    @cache.semantic_cache()
+    def search(query: str):
+        calls.append(query)
+        return [{"source": "test", "error": "boom"}]
+
+    search("q")
+    search("q")
+
+    assert len(calls) == 2
+
+
+def test_semantic_tier_reuses_close_queries_and_drops_replaced_vectors(clock, isolated_cache, monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    pytest.importorskip("faiss")
+    vectors = {
+        "nile university innovation": [1.0, 0.0],
+        "how does nu support innovation": [0.99, 0.141],
+        "unrelated": [0.0, 1.0],
+    }
+    monkeypatch.setattr(isolated_cache, "embed", lambda query: numpy.array(vectors[query], dtype="float32"))
+    search, calls = counting_search()
+
+    search("Nile University innovation")
+    search("How does NU support innovation")
+    search("unrelated")
+    assert calls == ["Nile University innovation", "unrelated"]
+
+    clock.now += isolated_cache.ttl + 1
+    search("Nile University innovation")
+    index, keys = next(iter(isolated_cache._indexes.values()))
+    assert index.ntotal == len(keys) == len(isolated_cache._store) == 1
@@ -0,0 +1,62 @@
+"""Result shaping of the search tools, with the HTTP layer stubbed out."""
+import asyncio
+from types import SimpleNamespace
+
+import tools
+
+
+def tavily_response(*urls):
+    return {"results": [{"title": url, "url": url, "content": "content", "score": 0.5} for url in urls]}
+
+
+def test_failed_domain_chunk_is_reported_and_not_cached(monkeypatch, isolated_cache):
+    domains = [f"site{i}.com" for i in range(12)]  # above the threshold -> two chunks
+
+    async def post_json(url, payload, headers=None):
+        if "site0.com" in payload["include_domains"]:
+            raise RuntimeError("503 Service Unavailable")
+        return tavily_response("https://site9.com/a")
+
+    monkeypatch.setattr(tools, "_post_json", post_json)
+    results = asyncio.run(tools.search_with_urls_async("q", domains))
+
+    assert [r["url"] for r in results if "error" not in r] == ["https://site9.com/a"]
+    assert results[-1]["source"] == "urls"
+    assert "site0.com" in results[-1]["error"] and "site9.com" not in results[-1]["error"]
+    assert isolated_cache._store == {}
+
+
+def test_session_domains_override_the_model_urls(monkeypatch):
+    sent = []
+
+    async def post_json(url, payload, headers=None):
+        sent.append(payload["include_domains"])
+        return tavily_response("https://nu.edu.eg/a")
+
+    monkeypatch.setattr(tools, "_post_json", post_json)
+    context = SimpleNamespace(state={"domains": ("nu.edu.eg",)})
+    asyncio.run(tools.search_with_urls_async("q", ["https://other.com"], tool_context=context))
+
+    assert sent == [["nu.edu.eg"]]
+
+
+def test_domain_search_without_valid_domains_is_refused(monkeypatch):
+    async def post_json(url, payload, headers=None):
+        raise AssertionError("unrestricted search was sent")
+
+    monkeypatch.setattr(tools, "_post_json", post_json)
+    results = asyncio.run(tools.search_with_urls_async("q", ["", None]))
+    combined = asyncio.run(tools.search_all("q", ["urls"], urls=[" "]))
+
+    assert results[0]["source"] == "urls" and "error" in results[0]
+    assert combined[0]["source"] == "search_all" and "error" in combined[0]
+
+
+def test_dedupe_keeps_the_record_with_a_real_snippet():
+    exa_fallback = tools._record("Title", "https://a.com", "Title", "exa")
+    tavily = tools._record("Title", "https://a.com", "real content", "tavily")
+    other = tools._record("Other", "https://b.com", "text", "exa")
+
+    merged = tools._merge_results(["exa", "tavily"], [[exa_fallback, other], [tavily]])
+
+    assert merged == [tavily, other]
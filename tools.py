@@ -1,106 +1,368 @@
 import os
+import re
+import atexit
 import time
+import asyncio
 import logging
-from typing import List
-from urllib.parse import urlparse
+import threading
+from functools import lru_cache
+from itertools import zip_longest
+from typing import Awaitable, Dict, List, Optional
+import httpx
+import orjson
 from dotenv import load_dotenv
 from google.adk.tools import FunctionTool
-from tavily import TavilyClient
-from exa_py import Exa
+from google.adk.tools.tool_context import ToolContext
+from cache import semantic_cache
 
 load_dotenv()
 tool_logger = logging.getLogger("ResearchTools")
 
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+EXA_SEARCH_URL = "https://api.exa.ai/search"
+HTTP_TIMEOUT = float(os.getenv("SEARCH_HTTP_TIMEOUT", "30"))
+
+# Transient API failures are retried with exponential backoff (0.3s, 0.6s, 1.2s)
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Tavily has no server-side snippet length option (include_raw_content=False is
+# already its default), so its content is capped locally per hit
+_SNIPPET_CHARS = 300
+
+# Upper bound on the characters a tool hands back to the LLM; whole records are
+# dropped (not snippets truncated) once it is reached
+_MAX_OUTPUT_CHARS = 4096
+
+# Tavily's include_domains filter slows down with long lists, so larger whitelists
+# are split into chunks searched concurrently and merged
+DOMAIN_CHUNK_THRESHOLD = 10
+DOMAIN_CHUNK_SIZE = 8
+
+# All outbound HTTP of the async tools runs on one long-lived background event loop
+# with a single AsyncClient. ADK's Runner.run starts a fresh thread + loop for every
+# request, so a client bound to the request's loop could never be shared (or safely
+# closed) across requests; going through the I/O loop keeps one connection pool
+# for the whole process.
+_io_loop = None
+_io_lock = threading.Lock()
+_async_client = None  # only touched from the I/O loop thread
+
+_DOMAIN_RE = re.compile(r'^(?:https?://)?(?:www\.)?([^/:?#]+)', re.IGNORECASE)
+
 def extract_domain(url: str) -> str:
     """Extract and clean domain from URL"""
-    try:
-        if "://" not in url: 
-            url = "http://" + url
-        parsed = urlparse(url)
-        domain = parsed.netloc
-        return domain[4:] if domain.startswith('www.') else domain
-    except:
+    if not isinstance(url, str):  # e.g. a null/number/list inside a JSON domains list
         return url
+    return _extract_domain(url)
+
+@lru_cache(maxsize=1024)
+def _extract_domain(url: str) -> str:
+    m = _DOMAIN_RE.match(url)
+    return m.group(1).lower() if m else url
+
+def normalize_domains(urls: List[str]) -> tuple:
+    """Clean a domains/URLs list once (deduplicated, order kept, non-string entries dropped)"""
+    return tuple(dict.fromkeys(extract_domain(u) for u in urls if isinstance(u, str) and u.strip()))
+
+def _get_io_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) and return the background loop that owns the shared AsyncClient"""
+    global _io_loop
+    with _io_lock:
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="search-io", daemon=True).start()
+            _io_loop = loop
+        return _io_loop
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the shared AsyncClient; must be called on the I/O loop"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        # HTTP/2 multiplexes concurrent calls to the same API host over one TLS connection.
+        # With an explicit transport, http2/limits only take effect when set on it.
+        _async_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                retries=RETRY_ATTEMPTS  # connection failures
+            )
+        )
+    return _async_client
+
+@atexit.register
+def _close_async_client():
+    if _io_loop is None:
+        return
+    if _async_client is not None and not _async_client.is_closed:
+        try:
+            asyncio.run_coroutine_threadsafe(_async_client.aclose(), _io_loop).result(timeout=5)
+        except Exception as e:
+            tool_logger.warning(f"Failed to close HTTP client: {e}")
+    _io_loop.call_soon_threadsafe(_io_loop.stop)
+
+def _read_concurrency_limit() -> int:
+    """TOOL_CONCURRENCY_LIMIT as a positive int, or 0 (unbounded) when unset or invalid"""
+    raw = os.getenv("TOOL_CONCURRENCY_LIMIT") or "0"
+    try:
+        return max(int(raw), 0)
+    except ValueError:
+        tool_logger.warning(f"Ignoring non-numeric TOOL_CONCURRENCY_LIMIT={raw!r}")
+        return 0
+
+# Cap on concurrent outbound calls within one search_all / domain-chunked search
+TOOL_CONCURRENCY_LIMIT = _read_concurrency_limit()
+
+def _concurrency_limit(batch_size: int) -> int:
+    """Resolve TOOL_CONCURRENCY_LIMIT, defaulting to the size of the batch"""
+    return TOOL_CONCURRENCY_LIMIT or max(batch_size, 1)
+
+async def dispatch_tool_calls(calls: List[Awaitable]) -> list:
+    """Await independent tool calls concurrently; results (or exceptions) keep call order"""
+    semaphore = asyncio.Semaphore(_concurrency_limit(len(calls)))
+
+    async def run(call):
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*(run(c) for c in calls), return_exceptions=True)
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), HTTP_TIMEOUT)
+    return RETRY_BACKOFF * (2 ** attempt)
+
+async def _post_json(url: str, payload: dict, headers: dict = None) -> dict:
+    """POST a JSON payload through the shared client and decode the JSON reply.
+    Runs on the I/O loop; cancelling the caller cancels the request there too."""
+    future = asyncio.run_coroutine_threadsafe(_post_json_on_io_loop(url, payload, headers), _get_io_loop())
+    return await asyncio.wrap_future(future)
+
+async def _post_json_on_io_loop(url: str, payload: dict, headers: dict = None) -> dict:
+    """Transient statuses (429/5xx gateway errors) are retried with backoff."""
+    client = _get_async_client()
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        response = await client.post(url, json=payload, headers=headers)
+        if response.status_code not in RETRY_STATUSES or attempt == RETRY_ATTEMPTS:
+            break
+        delay = _retry_delay(response, attempt)
+        tool_logger.warning(f"{url} returned {response.status_code}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    response.raise_for_status()
+    return orjson.loads(response.content)
 
-def search_tavily(query: str, search_depth: str = "advanced", max_results: int = 10) -> str:
+def _record(title, url, snippet, source: str) -> Dict[str, str]:
+    return {"title": title or "", "url": url or "", "snippet": snippet or "", "source": source}
+
+def _error(source: str, message: str) -> List[Dict[str, str]]:
+    return [{"source": source, "error": message}]
+
+def _within_budget(results: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Keep leading records until _MAX_OUTPUT_CHARS is reached (always at least one).
+    Error records are always kept, after the results, so the LLM sees what was skipped."""
+    total = 0
+    kept = []
+    errors = []
+    for r in results:
+        if "error" in r:
+            errors.append(r)
+            continue
+        total += sum(len(v) for v in r.values())
+        if kept and total > _MAX_OUTPUT_CHARS:
+            continue
+        kept.append(r)
+    return kept + errors
+
+def _tavily_results(response: dict, source: str = "tavily") -> List[Dict[str, str]]:
+    """Convert a Tavily search response into result records"""
+    results = [
+        _record(r.get('title'), r.get('url'), (r.get('content') or '')[:_SNIPPET_CHARS], source)
+        for r in response.get('results', [])
+    ]
+    if results and response.get('answer'):
+        results.insert(0, _record("Quick Summary", "", response['answer'], source))
+    return _within_budget(results)
+
+def _exa_results(results: List[dict]) -> List[Dict[str, str]]:
+    """Convert Exa search results (title/url/highlights dicts) into result records"""
+    return _within_budget([_record(r['title'], r['url'], (r['highlights'] or [r['title']])[0], "exa") for r in results])
+
+def _has_snippet(record: Dict[str, str]) -> bool:
+    """False for empty snippets and Exa's title-only fallback"""
+    return bool(record.get("snippet")) and record["snippet"] != record.get("title")
+
+def _dedupe_by_url(results: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Drop records whose URL was already returned by another engine. The first
+    position is kept, but a record with a real snippet replaces a title-only one."""
+    kept = []
+    positions = {}
+    for r in results:
+        url = r.get("url")
+        if not url:
+            kept.append(r)
+        elif url not in positions:
+            positions[url] = len(kept)
+            kept.append(r)
+        elif not _has_snippet(kept[positions[url]]) and _has_snippet(r):
+            kept[positions[url]] = r
+    return kept
+
+def _domain_chunks(domains: tuple) -> List[tuple]:
+    if len(domains) <= DOMAIN_CHUNK_THRESHOLD:
+        return [domains]
+    return [domains[i:i + DOMAIN_CHUNK_SIZE] for i in range(0, len(domains), DOMAIN_CHUNK_SIZE)]
+
+def _merge_domain_responses(responses: list, max_results: int) -> dict:
+    """Combine per-chunk Tavily responses: best score first, unique URLs, max_results kept.
+    Failed chunks are skipped (see _chunk_errors) unless every chunk failed."""
+    failures = [r for r in responses if isinstance(r, Exception)]
+    if len(failures) == len(responses):
+        raise failures[0]
+    if len(responses) == 1:
+        return responses[0]
+
+    hits = sorted(
+        (hit for r in responses if not isinstance(r, Exception) for hit in r.get('results', [])),
+        key=lambda hit: hit.get('score') or 0,
+        reverse=True
+    )
+    seen = set()
+    unique = [hit for hit in hits if hit.get('url') not in seen and not seen.add(hit.get('url'))]
+    return {"results": unique[:max_results]}
+
+def _chunk_errors(chunks: List[tuple], responses: list) -> List[Dict[str, str]]:
+    """Error record naming the domains whose chunk failed. It tells the LLM those
+    domains were not searched and keeps the partial result out of the cache."""
+    failed = [(chunk, r) for chunk, r in zip(chunks, responses) if isinstance(r, Exception)]
+    if not failed:
+        return []
+    domains = [d for chunk, _ in failed for d in chunk]
+    tool_logger.warning(f"Domain chunk search failed for {domains}: {failed[0][1]}")
+    return _error("urls", f"Search failed for domains {domains} ({failed[0][1]})")
+
+@semantic_cache(threshold=0.15)
+async def search_tavily_async(query: str, search_depth: str = "advanced", max_results: int = 10) -> List[Dict[str, str]]:
     """Search using Tavily for structured web results"""
     tool_logger.info(f"Tavily searching: {query}")
     try:
-        tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        response = tavily.search(
-            query=query, 
-            search_depth=search_depth, 
-            max_results=max_results, 
-            include_answer=True
-        )
-        
-        if not response.get('results'):
-            return f"Notice: No Tavily results for '{query}'."
-
-        formatted = f"**Tavily Data:**\n"
-        if response.get('answer'): 
-            formatted += f"Quick Summary: {response['answer']}\n"
-        
-        for i, r in enumerate(response['results'], 1):
-            formatted += f"{i}. {r['title']} - {r['url']}\nSnippet: {r['content'][:200]}\n"
-        
-        return formatted
+        response = await _post_json(TAVILY_SEARCH_URL, {
+            "api_key": os.getenv("TAVILY_API_KEY"),
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "include_answer": True,
+            "include_raw_content": False,
+            "include_images": False
+        })
+        return _tavily_results(response)
     except Exception as e:
         tool_logger.error(f"Tavily Error: {e}")
-        return f"Error: Tavily failed ({str(e)})"
+        return _error("tavily", f"Tavily failed ({str(e)})")
 
-def search_exa(query: str, num_results: int = 10, use_autoprompt: bool = True) -> str:
+@semantic_cache(threshold=0.15)
+async def search_exa_async(query: str, num_results: int = 10, use_autoprompt: bool = True) -> List[Dict[str, str]]:
     """Search using Exa for neural/semantic results"""
     tool_logger.info(f"Exa searching: {query}")
     try:
-        exa = Exa(api_key=os.getenv("EXA_API_KEY"))
-        response = exa.search_and_contents(
-            query=query, 
-            num_results=num_results, 
-            use_autoprompt=use_autoprompt, 
-            text={"max_characters": 800}
-        )
-        
-        if not response.results:
-            return f"Notice: No Exa results for '{query}'."
-
-        formatted = f"**Exa Neural Data:**\n"
-        for i, r in enumerate(response.results, 1):
-            formatted += f"{i}. {r.title} - {r.url}\nText: {r.text[:200]}...\n"
-        
-        return formatted
+        response = await _post_json(EXA_SEARCH_URL, {
+            "query": query,
+            "numResults": num_results,
+            "useAutoprompt": use_autoprompt,
+            "contents": {"highlights": {"numSentences": 2, "highlightsPerUrl": 1}}
+        }, headers={"x-api-key": os.getenv("EXA_API_KEY", "")})
+        results = [
+            {"title": r.get("title"), "url": r.get("url"), "highlights": r.get("highlights")}
+            for r in response.get("results", [])
+        ]
+        return _exa_results(results)
     except Exception as e:
         tool_logger.error(f"Exa Error: {e}")
-        return f"Error: Exa failed ({str(e)})"
+        return _error("exa", f"Exa failed ({str(e)})")
 
-def search_with_urls(query: str, urls: List[str], use_tool: str = "auto", max_results: int = 10) -> str:
-    """Search within specific URLs/domains only"""
-    tool_logger.info(f"Specific URL search in: {urls}")
-    domains = [extract_domain(u) for u in urls]
-    
+def _resolve_domains(urls: Optional[List[str]], tool_context: Optional[ToolContext]) -> tuple:
+    """Domains to restrict a search to: the session's list (normalized once at request
+    ingress by a2a_server) when the call runs in one, otherwise the caller's urls"""
+    if tool_context is not None:
+        domains = tool_context.state.get("domains")
+        if domains:
+            return tuple(domains)
+    return normalize_domains(urls or [])
+
+@semantic_cache(threshold=0.15)
+async def _search_domains(query: str, domains: tuple, max_results: int = 10) -> List[Dict[str, str]]:
+    """Tavily search restricted to already-normalized domains"""
     try:
-        tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        response = tavily.search(
-            query=query, 
-            include_domains=domains, 
-            max_results=max_results
-        )
-        
-        if not response.get('results'):
-            return f"Notice: No data found within domains {domains}."
-
-        formatted = f"**Targeted Domain Results:**\n"
-        for r in response['results']:
-            formatted += f"- {r['title']} ({r['url']}): {r['content'][:200]}\n"
-        
-        return formatted
+        chunks = _domain_chunks(domains)
+        responses = await dispatch_tool_calls([
+            _post_json(TAVILY_SEARCH_URL, {
+                "api_key": os.getenv("TAVILY_API_KEY"),
+                "query": query,
+                "include_domains": list(chunk),
+                "max_results": max_results,
+                "include_raw_content": False,
+                "include_images": False
+            })
+            for chunk in chunks
+        ])
+        results = _tavily_results(_merge_domain_responses(responses, max_results), source="urls")
+        return results + _chunk_errors(chunks, responses)
     except Exception as e:
         tool_logger.error(f"Domain search error: {e}")
-        return f"Error: Domain search failed ({str(e)})"
+        return _error("urls", f"Domain search failed ({str(e)})")
+
+async def search_with_urls_async(query: str, urls: List[str], use_tool: str = "auto", max_results: int = 10, tool_context: Optional[ToolContext] = None) -> List[Dict[str, str]]:
+    """Search within specific URLs/domains only"""
+    domains = _resolve_domains(urls, tool_context)
+    tool_logger.info(f"Specific URL search in: {list(domains)}")
+    if not domains:
+        # An empty include_domains would make this an unrestricted web search
+        return _error("urls", f"No valid domains in {urls}; a domain search needs at least one")
+    return await _search_domains(query, domains, max_results)
+
+SEARCH_ALL_SOURCES = ("tavily", "exa", "urls")
+
+def _select_sources(tools: List[str], domains: tuple):
+    """Validate the engines requested from search_all; returns (selected, error records)"""
+    selected = [t for t in dict.fromkeys(tools) if t in SEARCH_ALL_SOURCES]
+    if not selected:
+        return [], _error("search_all", f"No valid tools in {tools} (expected any of {list(SEARCH_ALL_SOURCES)})")
+    if "urls" in selected and not domains:
+        return [], _error("search_all", "urls (at least one valid domain) is required when 'urls' is among the tools")
+    return selected, None
+
+def _merge_results(selected: List[str], results: list) -> List[Dict[str, str]]:
+    """Interleave the engines' records so the output budget is shared between them"""
+    per_engine = [
+        _error(name, f"{name} failed ({r})") if isinstance(r, Exception) else r
+        for name, r in zip(selected, results)
+    ]
+    merged = [r for group in zip_longest(*per_engine) for r in group if r is not None]
+    return _within_budget(_dedupe_by_url(merged))
+
+async def search_all(query: str, tools: List[str], max_results: int = 10, urls: Optional[List[str]] = None, tool_context: Optional[ToolContext] = None) -> List[Dict[str, str]]:
+    """Run several search engines concurrently in one call and merge their results (deduplicated by URL).
+    tools: any of "tavily", "exa", "urls" ("urls" requires the urls/domains list)."""
+    tool_logger.info(f"Combined search ({', '.join(tools)}): {query}")
+    domains = _resolve_domains(urls, tool_context)
+    selected, error = _select_sources(tools, domains)
+    if error:
+        return error
+
+    sources = {
+        "tavily": lambda: search_tavily_async(query, max_results=max_results),
+        "exa": lambda: search_exa_async(query, num_results=max_results),
+        "urls": lambda: _search_domains(query, domains, max_results=max_results),
+    }
+    results = await dispatch_tool_calls([sources[t]() for t in selected])
+    return _merge_results(selected, results)
 
-# Register tools
-search_tavily_tool = FunctionTool(func=search_tavily)
-search_exa_tool = FunctionTool(func=search_exa)
-search_with_urls_tool = FunctionTool(func=search_with_urls)
+# Register tools (ADK awaits async tool functions, so parallel calls overlap on I/O)
+search_tavily_tool = FunctionTool(func=search_tavily_async)
+search_exa_tool = FunctionTool(func=search_exa_async)
+search_with_urls_tool = FunctionTool(func=search_with_urls_async)
+search_all_tool = FunctionTool(func=search_all)
 
-__all__ = ['search_tavily_tool', 'search_exa_tool', 'search_with_urls_tool']
\ No newline at end of file
+__all__ = ['search_tavily_tool', 'search_exa_tool', 'search_with_urls_tool', 'search_all_tool', 'dispatch_tool_calls', 'normalize_domains']